@@ -5,26 +5,52 @@ Defaults to 50 MB output, keeping audio.
 Requires ffmpeg and ffprobe in PATH.
 """
 import argparse
+import functools
 import json
 import math
 import shutil
 import subprocess
 import sys
+import tempfile
 from pathlib import Path
+from typing import List, Optional, Tuple
 
-
-def _check_bin(name: str) -> None:
-    if shutil.which(name) is None:
-        raise RuntimeError(f"{name} not found in PATH. Please install ffmpeg/ffprobe.")
+from probe_cache import probe_cached
 
 
-def _run(cmd):
-    subprocess.run(cmd, check=True)
+@functools.lru_cache(maxsize=None)
+def _check_bin(name: str) -> str:
+    path = shutil.which(name)
+    if path is None:
+        raise RuntimeError(f"{name} not found in PATH. Please install ffmpeg/ffprobe.")
+    return path
+
+
+def _run(cmd, duration: Optional[float] = None):
+    """Run ffmpeg, rendering its -progress output (blocking readline, no polling)."""
+    cmd = cmd[:1] + ["-progress", "pipe:1", "-nostats"] + cmd[1:]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True, bufsize=1)
+    out_time_s = 0.0
+    speed = ""
+    for line in proc.stdout:
+        key, _, value = line.strip().partition("=")
+        if key == "out_time_ms" and value.isdigit():
+            # despite the name, ffmpeg reports microseconds here
+            out_time_s = int(value) / 1_000_000
+        elif key == "speed":
+            speed = value
+        elif key == "progress":
+            done = f"{min(out_time_s / duration, 1.0) * 100:5.1f}%" if duration else f"{out_time_s:.1f}s"
+            print(f"\r  {done} speed={speed}", end="" if value != "end" else "\n", file=sys.stderr, flush=True)
+    proc.stdout.close()
+    returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
 
 
 def _probe_duration(path: Path) -> float:
     cmd = [
-        "ffprobe",
+        _check_bin("ffprobe"),
         "-v",
         "error",
         "-show_entries",
@@ -34,13 +60,18 @@ def _probe_duration(path: Path) -> float:
         str(path),
     ]
     out = subprocess.check_output(cmd)
-    data = json.loads(out.decode("utf-8"))
+    data = json.loads(out)
     dur = float(data["format"]["duration"])
     if dur <= 0:
         raise RuntimeError("Invalid duration from ffprobe")
     return dur
 
 
+def _probe_duration_cached(path: Path) -> float:
+    """Like _probe_duration, but reuses <input>.ffprobe.json while the input is unchanged."""
+    return float(probe_cached(path, "duration", _probe_duration))
+
+
 def _default_output(input_path: Path) -> Path:
     return input_path.with_name(f"{input_path.stem}_compressed.mp4")
 
@@ -56,42 +87,60 @@ def _calc_bitrates(target_mb: float, duration_s: float, audio_kbps: int, safety:
     return max(video_bps, 200_000)
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser(description="Compress a video to target size using ffmpeg")
-    parser.add_argument("--input", required=True, help="Input video path (decrypted MP4)")
-    parser.add_argument("--output", help="Output path (default: *_compressed.mp4)")
-    parser.add_argument("--target-mb", type=float, default=50.0, help="Target size in MB (default: 50)")
-    parser.add_argument("--audio-bitrate", type=int, default=96, help="Audio bitrate in kbps (default: 96)")
-    parser.add_argument("--preset", default="medium", help="ffmpeg preset (default: medium)")
-    parser.add_argument("--retries", type=int, default=2, help="Extra attempts if file still too large")
-    parser.add_argument("--safety", type=float, default=0.96, help="Bitrate safety factor (default: 0.96)")
-    args = parser.parse_args()
+CODECS = {
+    "x264": "libx264",
+    "x265": "libx265",
+    "h264_nvenc": "h264_nvenc",
+    "hevc_nvenc": "hevc_nvenc",
+}
 
-    _check_bin("ffmpeg")
-    _check_bin("ffprobe")
 
-    in_path = Path(args.input)
-    if not in_path.exists():
-        raise RuntimeError(f"Input not found: {in_path}")
+@functools.lru_cache(maxsize=None)
+def _ffmpeg_encoders() -> str:
+    return subprocess.check_output([_check_bin("ffmpeg"), "-hide_banner", "-encoders"], text=True)
+
+
+def _check_encoder(codec: str) -> None:
+    encoder = CODECS[codec]
+    if encoder.endswith("_nvenc") and encoder not in _ffmpeg_encoders():
+        raise RuntimeError(f"{encoder} not available in this ffmpeg build (needs NVENC support)")
+
 
-    out_path = Path(args.output) if args.output else _default_output(in_path)
+def _rate_control_args(codec: str, passlog: str, pass_no: Optional[int]) -> List[str]:
+    if codec == "x264":
+        return ["-passlogfile", passlog, "-pass", str(pass_no)]
+    if codec == "x265":
+        return ["-x265-params", f"pass={pass_no}:stats={passlog}.log"]
+    # NVENC: single-pass constrained VBR
+    return ["-rc", "vbr", "-cq", "23"]
 
-    duration = _probe_duration(in_path)
 
-    safety = args.safety
-    for attempt in range(args.retries + 1):
-        video_bps = _calc_bitrates(args.target_mb, duration, args.audio_bitrate, safety)
-        video_k = int(video_bps / 1000)
+def _encode(
+    jobs: List[Tuple[Path, Path, int]],
+    audio_kbps: int,
+    preset: str,
+    codec: str = "x264",
+    duration: Optional[float] = None,
+) -> None:
+    """Encode (input, output, video kbps) jobs, all in one ffmpeg process per pass.
+
+    x264/x265 run two passes; NVENC codecs run a single pass.
+    """
+    two_pass = codec in ("x264", "x265")
+    passdir = tempfile.mkdtemp(prefix="compress_video_")
+    inputs: List[str] = []
+    pass1: List[str] = []
+    pass2: List[str] = []
+    for i, (in_path, out_path, video_k) in enumerate(jobs):
         maxrate_k = int(video_k * 1.07)
         bufsize_k = int(video_k * 2)
-
-        cmd = [
-            "ffmpeg",
-            "-y",
-            "-i",
-            str(in_path),
+        passlog = str(Path(passdir) / f"ffmpeg2pass{i}")
+        inputs += ["-i", str(in_path)]
+        video_args = [
+            "-map",
+            f"{i}:v:0",
             "-c:v",
-            "libx264",
+            CODECS[codec],
             "-b:v",
             f"{video_k}k",
             "-maxrate",
@@ -99,27 +148,87 @@ def main() -> None:
             "-bufsize",
             f"{bufsize_k}k",
             "-preset",
-            args.preset,
+            preset,
+        ]
+        if two_pass:
+            # pass 1 only gathers rate statistics, so skip audio and discard the output
+            pass1 += video_args + _rate_control_args(codec, passlog, 1) + ["-an", "-f", "null", "-"]
+        pass2 += video_args + _rate_control_args(codec, passlog, 2 if two_pass else None) + [
+            "-map",
+            f"{i}:a:0?",
             "-c:a",
             "aac",
             "-b:a",
-            f"{args.audio_bitrate}k",
+            f"{audio_kbps}k",
             "-movflags",
             "+faststart",
             str(out_path),
         ]
-        _run(cmd)
+    try:
+        if two_pass:
+            _run([_check_bin("ffmpeg"), "-y"] + inputs + pass1, duration)
+        _run([_check_bin("ffmpeg"), "-y"] + inputs + pass2, duration)
+    finally:
+        shutil.rmtree(passdir, ignore_errors=True)
 
-        size_mb = out_path.stat().st_size / (1024 * 1024)
-        if size_mb <= args.target_mb:
-            print(f"OK: {out_path} ({size_mb:.2f} MB)")
-            return
 
-        # reduce bitrate and retry
-        safety *= 0.9
-        print(f"Retry {attempt + 1}: size {size_mb:.2f} MB > {args.target_mb} MB, lowering bitrate")
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compress a video to target size using ffmpeg")
+    parser.add_argument("--input", required=True, action="append",
+                        help="Input video path (decrypted MP4); repeat to compress several in one ffmpeg run")
+    parser.add_argument("--output", action="append",
+                        help="Output path, once per --input (default: *_compressed.mp4)")
+    parser.add_argument("--target-mb", type=float, default=50.0, help="Target size in MB (default: 50)")
+    parser.add_argument("--audio-bitrate", type=int, default=96, help="Audio bitrate in kbps (default: 96)")
+    parser.add_argument("--preset", default="medium", help="ffmpeg preset (default: medium)")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="x264",
+                        help="Video encoder; *_nvenc needs an NVIDIA GPU (default: x264)")
+    parser.add_argument("--retries", type=int, default=1,
+                        help="Ignored; kept for compatibility (two-pass encoding makes one fallback attempt)")
+    parser.add_argument("--safety", type=float, default=0.96, help="Bitrate safety factor (default: 0.96)")
+    args = parser.parse_args()
+
+    if args.output and len(args.output) != len(args.input):
+        parser.error("Pass --output once per --input, or omit it")
+
+    _check_bin("ffmpeg")
+    _check_bin("ffprobe")
+    _check_encoder(args.codec)
+
+    in_paths = [Path(p) for p in args.input]
+    for in_path in in_paths:
+        if not in_path.exists():
+            raise RuntimeError(f"Input not found: {in_path}")
+
+    out_paths = [Path(p) for p in args.output] if args.output else [_default_output(p) for p in in_paths]
+    durations = [_probe_duration_cached(p) for p in in_paths]
+
+    # Bitrate-targeted encodes land close to the target; keep a single lower-bitrate fallback for overshoot.
+    fallbacks = [args.safety, args.safety * 0.9]
+    pending = list(range(len(in_paths)))
+    for attempt, safety in enumerate(fallbacks):
+        jobs = []
+        for i in pending:
+            video_bps = _calc_bitrates(args.target_mb, durations[i], args.audio_bitrate, safety)
+            jobs.append((in_paths[i], out_paths[i], int(video_bps / 1000)))
+        _encode(jobs, args.audio_bitrate, args.preset, args.codec, max(durations[i] for i in pending))
+
+        still_large = []
+        for i in pending:
+            size_mb = out_paths[i].stat().st_size / (1024 * 1024)
+            if size_mb <= args.target_mb:
+                print(f"OK: {out_paths[i]} ({size_mb:.2f} MB)")
+            else:
+                still_large.append(i)
+                if attempt < len(fallbacks) - 1:
+                    print(f"Retry {attempt + 1}: {out_paths[i]} size {size_mb:.2f} MB > {args.target_mb} MB, "
+                          "lowering bitrate")
+        pending = still_large
+        if not pending:
+            return
 
-    raise RuntimeError(f"Failed to reach target size {args.target_mb} MB. Last output: {out_path}")
+    failed = ", ".join(str(out_paths[i]) for i in pending)
+    raise RuntimeError(f"Failed to reach target size {args.target_mb} MB. Last output: {failed}")
 
 
 if __name__ == "__main__":
@@ -1,15 +1,45 @@
 #!/usr/bin/env python3
 """Extract audio from a video using ffmpeg."""
 import argparse
+import functools
 import shutil
 import subprocess
 import sys
 from pathlib import Path
 
+from probe_cache import probe_cached
 
-def _check_bin(name: str) -> None:
-    if shutil.which(name) is None:
+
+@functools.lru_cache(maxsize=None)
+def _check_bin(name: str) -> str:
+    path = shutil.which(name)
+    if path is None:
         raise RuntimeError(f"{name} not found in PATH. Please install ffmpeg.")
+    return path
+
+
+def _probe_audio_codec(path: Path) -> str:
+    cmd = [
+        _check_bin("ffprobe"),
+        "-v",
+        "error",
+        "-select_streams",
+        "a:0",
+        "-show_entries",
+        "stream=codec_name",
+        "-of",
+        "csv=p=0",
+        str(path),
+    ]
+    return subprocess.check_output(cmd, text=True).strip()
+
+
+def _probe_audio_codec_cached(path: Path) -> str:
+    """Like _probe_audio_codec, but shares compress_video_to_size's <input>.ffprobe.json sidecar."""
+    return str(probe_cached(path, "audio_codec", _probe_audio_codec))
+
+
+STREAM_FORMATS = {"aac": "adts", "mp3": "mp3", "flac": "flac", "opus": "opus"}
 
 
 def _default_output(input_path: Path, codec: str) -> Path:
@@ -20,9 +50,11 @@ def _default_output(input_path: Path, codec: str) -> Path:
 def main() -> None:
     parser = argparse.ArgumentParser(description="Extract audio from a video using ffmpeg")
     parser.add_argument("--input", required=True, help="Input video path")
-    parser.add_argument("--output", help="Output audio path (default based on codec)")
+    parser.add_argument("--output", help="Output audio path, or - to stream to stdout (default based on codec)")
     parser.add_argument("--codec", default="aac", help="Audio codec (default: aac)")
-    parser.add_argument("--bitrate", type=int, default=128, help="Audio bitrate kbps (default: 128)")
+    parser.add_argument("--bitrate", type=int,
+                        help="Audio bitrate kbps; forces a re-encode (default: copy the source audio if it "
+                             "already uses --codec, otherwise re-encode at 128)")
     args = parser.parse_args()
 
     _check_bin("ffmpeg")
@@ -31,20 +63,33 @@ def main() -> None:
     if not in_path.exists():
         raise RuntimeError(f"Input not found: {in_path}")
 
-    out_path = Path(args.output) if args.output else _default_output(in_path, args.codec)
+    to_stdout = args.output == "-"
+    if to_stdout:
+        if args.codec not in STREAM_FORMATS:
+            raise RuntimeError(f"Cannot stream codec {args.codec} to stdout; use one of {', '.join(STREAM_FORMATS)}")
+        out_args = ["-f", STREAM_FORMATS[args.codec], "pipe:1"]
+    else:
+        out_path = Path(args.output) if args.output else _default_output(in_path, args.codec)
+        out_args = [str(out_path)]
 
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-i",
-        str(in_path),
-        "-vn",
-        "-c:a",
-        args.codec,
-        "-b:a",
-        f"{args.bitrate}k",
-        str(out_path),
-    ]
+    source_codec = None
+    if args.bitrate is None:
+        try:
+            source_codec = _probe_audio_codec_cached(in_path)
+        except (RuntimeError, OSError, subprocess.CalledProcessError) as exc:
+            # The probe only enables stream copy; re-encode if ffprobe is missing or fails.
+            print(f"Could not probe source audio codec ({exc}); re-encoding", file=sys.stderr)
+    if source_codec == args.codec:
+        print(f"Source audio is already {args.codec}, copying without re-encoding", file=sys.stderr)
+        codec_args = ["-c:a", "copy"]
+    else:
+        codec_args = ["-c:a", args.codec, "-b:a", f"{args.bitrate or 128}k"]
+
+    cmd = [_check_bin("ffmpeg"), "-y", "-i", str(in_path), "-vn"] + codec_args + out_args
+    if to_stdout:
+        subprocess.run(cmd, check=True, stdout=sys.stdout.buffer)
+        print("OK: <stdout>", file=sys.stderr)
+        return
     subprocess.run(cmd, check=True)
     print(f"OK: {out_path}")
 
@@ -0,0 +1,36 @@
+"""Sidecar cache for ffprobe results, shared by the media utility scripts.
+
+Results are stored in <input>.ffprobe.json and reused while the input's
+mtime and size are unchanged. Each script stores its own field; fields
+written by other scripts for the same file are kept.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+
+def probe_cached(path: Path, field: str, probe: Callable[[Path], Any]) -> Any:
+    """Return field from the sidecar of path, running probe(path) and saving it on a miss."""
+    sidecar = path.with_suffix(path.suffix + ".ffprobe.json")
+    st = path.stat()
+    entry: Dict[str, Any] = {}
+    try:
+        cached = json.loads(sidecar.read_text(encoding="utf-8"))
+        if cached["mtime_ns"] == st.st_mtime_ns and cached["size"] == st.st_size:
+            entry = cached
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    if field in entry:
+        return entry[field]
+
+    value = probe(path)
+    entry.update({"path": str(path), "mtime_ns": st.st_mtime_ns, "size": st.st_size, field: value})
+    tmp = sidecar.with_name(f"{sidecar.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_text(json.dumps(entry), encoding="utf-8")
+        os.replace(tmp, sidecar)
+    except OSError:
+        # Caching is best effort (e.g. read-only input directory).
+        tmp.unlink(missing_ok=True)
+    return value
@@ -7,25 +7,92 @@
 - Decrypt using local decrypt API keystream endpoint
 """
 import argparse
+import functools
+import hashlib
+import heapq
 import json
+import mmap
+import os
+import queue
+import shutil
 import sys
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone
+from operator import itemgetter
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import numpy as np
+except ImportError:  # optional: falls back to a bigint XOR
+    np = None
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to resp.json() / json
+    orjson = None
 
 API_BASE = "https://api.tikhub.io"
+CACHE_DIR = Path.home() / ".cache" / "tikhub"
+
+# Pooled connections shared by the TikHub API, the CDN download and the decrypt API.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+# Client for the small JSON calls; main() swaps in an HTTP/2 httpx.Client for --http2.
+API_CLIENT: Any = SESSION
 
 
+def _http2_client() -> Any:
+    try:
+        import httpx
+    except ImportError:
+        raise RuntimeError("--http2 requires httpx: pip install 'httpx[http2]'") from None
+    return httpx.Client(http2=True)
+
+
+def _cached_response(func: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+    """Cache successful API responses under CACHE_DIR; enabled per call with cache_ttl > 0."""
+    @functools.wraps(func)
+    def wrapper(api_key: str, path: str, params: Dict[str, Any], *args: Any,
+                cache_ttl: float = 0, **kwargs: Any) -> Dict[str, Any]:
+        if cache_ttl <= 0:
+            return func(api_key, path, params, *args, **kwargs)
+        key_src = json.dumps([path, sorted(params.items())], ensure_ascii=False, default=str)
+        key = hashlib.blake2b(key_src.encode("utf-8"), digest_size=20).hexdigest()
+        cache_path = CACHE_DIR / f"{key}.json"
+        try:
+            entry = json.loads(cache_path.read_text(encoding="utf-8"))
+            if time.time() - entry["ts"] < cache_ttl:
+                return entry["data"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        data = func(api_key, path, params, *args, **kwargs)
+        tmp = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps({"ts": time.time(), "data": data}, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, cache_path)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+        return data
+    return wrapper
+
+
+@_cached_response
 def _api_get(api_key: str, path: str, params: Dict[str, Any], retries: int, retry_wait: float) -> Dict[str, Any]:
     url = f"{API_BASE}{path}"
     last_err = None
     for attempt in range(retries):
-        resp = requests.get(url, params=params, headers={"Authorization": f"Bearer {api_key}"}, timeout=30)
+        resp = API_CLIENT.get(url, params=params, headers={"Authorization": f"Bearer {api_key}"}, timeout=30)
         if resp.status_code == 200:
-            data = resp.json()
+            data = orjson.loads(resp.content) if orjson is not None else resp.json()
             if data.get("code") == 200:
                 return data
             last_err = f"API error: {data}"
@@ -58,17 +125,73 @@ def _human_time(ts: Optional[int]) -> str:
     return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
 
-def _download_file(url: str, out_path: Path) -> None:
-    with requests.get(url, stream=True, timeout=60) as resp:
+def _write_chunks(chunks: Iterable[bytes], f: BinaryIO, background: bool = False, depth: int = 4) -> None:
+    """Write chunks to f, optionally from a writer thread so reading overlaps with disk writes."""
+    if not background:
+        for chunk in chunks:
+            if chunk:
+                f.write(chunk)
+        return
+
+    pending: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=depth)
+    errors: List[BaseException] = []
+
+    def writer() -> None:
+        while True:
+            buf = pending.get()
+            if buf is None:
+                return
+            if not errors:
+                try:
+                    f.write(buf)
+                except BaseException as exc:
+                    errors.append(exc)
+
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    try:
+        for chunk in chunks:
+            if errors:
+                break
+            if chunk:
+                pending.put(chunk)
+    finally:
+        pending.put(None)
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def _preallocate(f: BinaryIO, resp: requests.Response) -> None:
+    """Reserve Content-Length bytes up front so the filesystem can allocate one extent."""
+    content_length = resp.headers.get("Content-Length")
+    if not content_length or not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(f.fileno(), 0, int(content_length))
+    except (OSError, ValueError):
+        pass  # best effort: unsupported filesystem or bogus header
+
+
+def _download_file(url: str, out_path: Path, overlap_io: bool = False) -> None:
+    with SESSION.get(url, stream=True, timeout=60) as resp:
         resp.raise_for_status()
+        resp.raw.decode_content = True
         with out_path.open("wb") as f:
-            for chunk in resp.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    f.write(chunk)
+            _preallocate(f, resp)
+            try:
+                if overlap_io:
+                    chunks = iter(functools.partial(resp.raw.read, 4 * 1024 * 1024), b"")
+                    _write_chunks(chunks, f, background=True)
+                else:
+                    shutil.copyfileobj(resp.raw, f, length=4 * 1024 * 1024)
+            finally:
+                # fallocate extends the file; drop any excess so a broken download stays visibly short
+                f.truncate(f.tell())
 
 
 def _fetch_keystream(decrypt_api: str, decode_key: str) -> bytes:
-    resp = requests.post(f"{decrypt_api.rstrip('/')}/api/keystream", json={"decode_key": str(decode_key)}, timeout=30)
+    resp = API_CLIENT.post(f"{decrypt_api.rstrip('/')}/api/keystream", json={"decode_key": str(decode_key)}, timeout=30)
     resp.raise_for_status()
     data = resp.json()
     keystream_hex = data.get("keystream")
@@ -77,18 +200,177 @@ def _fetch_keystream(decrypt_api: str, decode_key: str) -> bytes:
     return bytes.fromhex(keystream_hex)
 
 
+def _xor_bytes(data: bytes, keystream: bytes) -> bytes:
+    """XOR data with the leading bytes of keystream (data may be shorter)."""
+    if np is not None:
+        data_arr = np.frombuffer(data, dtype=np.uint8)
+        ks_arr = np.frombuffer(keystream, dtype=np.uint8)
+        return np.bitwise_xor(data_arr, ks_arr[:len(data_arr)]).tobytes()
+    n = len(data)
+    return (int.from_bytes(data, "big") ^ int.from_bytes(keystream[:n], "big")).to_bytes(n, "big")
+
+
+def _xor_into(dst: memoryview, src: memoryview, keystream: bytes) -> None:
+    """XOR src with the leading keystream bytes, writing the result straight into dst."""
+    if np is not None:
+        np.bitwise_xor(
+            np.frombuffer(src, dtype=np.uint8),
+            np.frombuffer(keystream, dtype=np.uint8, count=len(src)),
+            out=np.frombuffer(dst, dtype=np.uint8),
+        )
+    else:
+        dst[:] = _xor_bytes(src, keystream)
+
+
 def _decrypt_file(enc_path: Path, out_path: Path, keystream: bytes) -> None:
-    with enc_path.open("rb") as fin, out_path.open("wb") as fout:
-        head = fin.read(len(keystream))
-        if not head:
-            raise RuntimeError("Encrypted file is empty")
-        dec_head = bytes(a ^ b for a, b in zip(head, keystream))
-        fout.write(dec_head)
-        while True:
-            buf = fin.read(1024 * 1024)
-            if not buf:
-                break
-            fout.write(buf)
+    size = enc_path.stat().st_size
+    if size == 0:
+        raise RuntimeError("Encrypted file is empty")
+    head_len = min(size, len(keystream))
+    with enc_path.open("rb") as fin, out_path.open("w+b") as fout:
+        fout.truncate(size)
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as src_mm, \
+                mmap.mmap(fout.fileno(), 0, access=mmap.ACCESS_WRITE) as dst_mm:
+            with memoryview(src_mm) as src, memoryview(dst_mm) as dst:
+                _xor_into(dst[:head_len], src[:head_len], keystream)
+                # Only the header is encrypted; copy the rest without decoding it.
+                if sys.platform.startswith("linux"):
+                    # Deepen kernel readahead so reads stay queued ahead of sendfile's writes.
+                    os.posix_fadvise(fin.fileno(), head_len, 0, os.POSIX_FADV_SEQUENTIAL)
+                    offset = head_len
+                    os.lseek(fout.fileno(), offset, os.SEEK_SET)
+                    while offset < size:
+                        sent = os.sendfile(fout.fileno(), fin.fileno(), offset, min(size - offset, 1 << 30))
+                        if sent == 0:
+                            break
+                        offset += sent
+                else:
+                    if hasattr(mmap, "MADV_SEQUENTIAL"):
+                        src_mm.madvise(mmap.MADV_SEQUENTIAL)
+                    dst[head_len:] = src[head_len:]
+
+
+def _decrypt_stream(chunks: Iterable[bytes], keystream: bytes) -> Iterator[bytes]:
+    """XOR the leading keystream bytes of a chunk stream, pass the rest through."""
+    header_remaining = len(keystream)
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if header_remaining > 0:
+            offset = len(keystream) - header_remaining
+            header_part, chunk = chunk[:header_remaining], chunk[header_remaining:]
+            yield _xor_bytes(header_part, keystream[offset:])
+            header_remaining -= len(header_part)
+        if chunk:
+            yield chunk
+    if header_remaining == len(keystream):
+        raise RuntimeError("Encrypted file is empty")
+
+
+def _download_and_decrypt(url: str, out_path: Path, keystream_future: "Future[bytes]",
+                          overlap_io: bool = False) -> None:
+    """Download and decrypt in one pass, without writing the encrypted file.
+
+    The keystream is only awaited once the download response is open, so its request
+    overlaps with connecting to the CDN. Data goes to a .part file that only replaces
+    out_path once complete, so an existing out_path is never a broken download.
+    """
+    part_path = out_path.with_name(out_path.name + ".part")
+    try:
+        with SESSION.get(url, stream=True, timeout=60) as resp:
+            resp.raise_for_status()
+            keystream = keystream_future.result()
+            print(f"Keystream length: {len(keystream)} bytes")
+            with part_path.open("wb") as f:
+                _preallocate(f, resp)
+                try:
+                    chunks = resp.iter_content(chunk_size=4 * 1024 * 1024)
+                    _write_chunks(_decrypt_stream(chunks, keystream), f, background=overlap_io)
+                finally:
+                    f.truncate(f.tell())
+        os.replace(part_path, out_path)
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+
+
+def _process_video(video: Dict[str, Any], username: str, outdir: Path, args: argparse.Namespace,
+                   label: str = "Latest video") -> None:
+    """Save metadata for one home-page video, then download and decrypt it."""
+    video_id = video.get("id")
+    desc = (video.get("object_desc", {}).get("description") or "").replace("\n", " ")
+    createtime = video.get("createtime")
+    media = (video.get("object_desc", {}) or {}).get("media", [])
+    if not media:
+        raise RuntimeError(f"Video {video_id} has no media")
+    url = media[0].get("url")
+    url_token = media[0].get("url_token") or ""
+    decode_key = media[0].get("decode_key")
+    if not url or not decode_key:
+        raise RuntimeError(f"Missing url or decode_key in media of video {video_id}")
+    full_url = url + url_token
+
+    enc_path = outdir / f"{video_id}_encrypted.mp4"
+    dec_path = outdir / f"{video_id}_decrypted.mp4"
+    meta_path = outdir / f"{video_id}_meta.json"
+
+    print(f"{label}:")
+    print(f"  id: {video_id}")
+    print(f"  desc: {desc}")
+    print(f"  createtime: {createtime} ({_human_time(createtime)})")
+    print(f"  decode_key: {decode_key}")
+
+    meta = {
+        "username": username,
+        "latest_id": video_id,
+        "description": desc,
+        "createtime": createtime,
+        "createtime_utc": _human_time(createtime),
+        "decode_key": decode_key,
+        "url": url,
+        "url_token": url_token,
+    }
+    if orjson is not None:
+        meta_path.write_bytes(orjson.dumps(meta, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Saved metadata: {meta_path}")
+
+    # Without an encrypted copy to keep or reuse, download and decrypt in a single pass.
+    stream_decrypt = not (args.skip_decrypt or args.keep_encrypted or args.skip_download)
+    if args.skip_download and not (args.skip_decrypt or args.keep_encrypted) and dec_path.exists():
+        print(f"Skip download, using existing file: {dec_path}")
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        # The keystream only depends on decode_key, so fetch it while the video downloads.
+        keystream_future = None
+        if not args.skip_decrypt:
+            print(f"Requesting keystream from {args.decrypt_api}...")
+            keystream_future = pool.submit(_fetch_keystream, args.decrypt_api, str(decode_key))
+
+        if args.skip_download:
+            if not enc_path.exists():
+                raise RuntimeError(f"Encrypted file not found: {enc_path}")
+            print(f"Skip download, using existing file: {enc_path}")
+        elif not stream_decrypt:
+            print(f"Downloading to {enc_path}...")
+            _download_file(full_url, enc_path, overlap_io=args.overlap_io)
+            print(f"Downloaded {enc_path} ({enc_path.stat().st_size} bytes)")
+
+        if keystream_future is None:
+            print("Skip decrypt step")
+            return
+
+        if stream_decrypt:
+            print(f"Downloading and decrypting to {dec_path}...")
+            _download_and_decrypt(full_url, dec_path, keystream_future, overlap_io=args.overlap_io)
+        else:
+            keystream = keystream_future.result()
+            print(f"Keystream length: {len(keystream)} bytes")
+            print(f"Decrypting to {dec_path}...")
+            _decrypt_file(enc_path, dec_path, keystream)
+    print(f"Decrypted file: {dec_path} ({dec_path.stat().st_size} bytes)")
 
 
 def main() -> None:
@@ -99,16 +381,34 @@ def main() -> None:
     parser.add_argument("--user-index", type=int, default=0, help="Index in search results to use (default: 0)")
     parser.add_argument("--username", help="WeChat Channels username (skips search if provided)")
     parser.add_argument("--outdir", default="output", help="Output directory")
+    parser.add_argument("--top-k", type=int, default=1, help="Download the N latest videos (default: 1)")
     parser.add_argument("--decrypt-api", default="http://localhost:3005", help="Decrypt API base URL")
     parser.add_argument("--skip-decrypt", action="store_true", help="Skip decryption step")
-    parser.add_argument("--skip-download", action="store_true", help="Skip download if encrypted file exists")
+    parser.add_argument("--skip-download", action="store_true",
+                        help="Don't download: reuse an existing decrypted file (unless --keep-encrypted or "
+                             "--skip-decrypt), otherwise use the existing encrypted file")
+    parser.add_argument("--keep-encrypted", action="store_true",
+                        help="Save the encrypted file and decrypt it in a second step (default: stream-decrypt)")
+    parser.add_argument("--overlap-io", action="store_true",
+                        help="Write downloads from a background thread so network reads overlap disk writes")
     parser.add_argument("--retries", type=int, default=3, help="API retry attempts (default: 3)")
     parser.add_argument("--retry-wait", type=float, default=2.0, help="Seconds between retries (default: 2.0)")
+    parser.add_argument("--http2", action="store_true",
+                        help="Use HTTP/2 (httpx) for TikHub API and keystream requests")
+    parser.add_argument("--cache-ttl", type=float, default=0,
+                        help="Reuse API responses cached in ~/.cache/tikhub for this many seconds "
+                             "(default: 0, off; download URLs and decode keys may expire)")
 
     args = parser.parse_args()
 
     if not args.username and not args.keyword:
         parser.error("Provide --username or --keyword")
+    if args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+
+    if args.http2:
+        global API_CLIENT
+        API_CLIENT = _http2_client()
 
     outdir = Path(args.outdir)
     outdir.mkdir(parents=True, exist_ok=True)
@@ -118,7 +418,7 @@ def main() -> None:
         res = _api_get(args.api_key, "/api/v1/wechat_channels/fetch_user_search", {
             "keywords": args.keyword,
             "page": args.page,
-        }, retries=args.retries, retry_wait=args.retry_wait)
+        }, retries=args.retries, retry_wait=args.retry_wait, cache_ttl=args.cache_ttl)
         data = res.get("data", [])
         print(f"Search results: {len(data)}")
         for i, item in enumerate(data[:10]):
@@ -134,71 +434,22 @@ def main() -> None:
         print(f"Selected username: {username}")
 
     home = _api_get(args.api_key, "/api/v1/wechat_channels/fetch_home_page", {"username": username},
-                    retries=args.retries, retry_wait=args.retry_wait)
+                    retries=args.retries, retry_wait=args.retry_wait, cache_ttl=args.cache_ttl)
     home_data = home.get("data", {})
     videos = _get_object_list(home_data)
     print(f"Videos fetched: {len(videos)}")
     if not videos:
         raise RuntimeError("No videos found in home page response")
 
-    # Sort by createtime to find latest
-    latest = max(videos, key=lambda x: x.get("createtime") or 0)
-    latest_id = latest.get("id")
-    desc = (latest.get("object_desc", {}).get("description") or "").replace("\n", " ")
-    createtime = latest.get("createtime")
-    media = (latest.get("object_desc", {}) or {}).get("media", [])
-    if not media:
-        raise RuntimeError("Latest video has no media")
-    url = media[0].get("url")
-    url_token = media[0].get("url_token") or ""
-    decode_key = media[0].get("decode_key")
-    if not url or not decode_key:
-        raise RuntimeError("Missing url or decode_key in latest media")
-    full_url = url + url_token
-
-    enc_path = outdir / f"{latest_id}_encrypted.mp4"
-    dec_path = outdir / f"{latest_id}_decrypted.mp4"
-    meta_path = outdir / f"{latest_id}_meta.json"
-
-    print("Latest video:")
-    print(f"  id: {latest_id}")
-    print(f"  desc: {desc}")
-    print(f"  createtime: {createtime} ({_human_time(createtime)})")
-    print(f"  decode_key: {decode_key}")
-
-    if args.skip_download:
-        if not enc_path.exists():
-            raise RuntimeError(f"Encrypted file not found: {enc_path}")
-        print(f"Skip download, using existing file: {enc_path}")
-    else:
-        print(f"Downloading to {enc_path}...")
-        _download_file(full_url, enc_path)
-        print(f"Downloaded {enc_path} ({enc_path.stat().st_size} bytes)")
-
-    meta = {
-        "username": username,
-        "latest_id": latest_id,
-        "description": desc,
-        "createtime": createtime,
-        "createtime_utc": _human_time(createtime),
-        "decode_key": decode_key,
-        "url": url,
-        "url_token": url_token,
-    }
-    meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(f"Saved metadata: {meta_path}")
-
-    if args.skip_decrypt:
-        print("Skip decrypt step")
+    # Rank by createtime to find the latest
+    ranked = [(video.get("createtime") or 0, i) for i, video in enumerate(videos)]
+    if args.top_k == 1:
+        _, best_idx = max(ranked, key=itemgetter(0))
+        _process_video(videos[best_idx], username, outdir, args)
         return
-
-    print(f"Requesting keystream from {args.decrypt_api}...")
-    keystream = _fetch_keystream(args.decrypt_api, str(decode_key))
-    print(f"Keystream length: {len(keystream)} bytes")
-
-    print(f"Decrypting to {dec_path}...")
-    _decrypt_file(enc_path, dec_path, keystream)
-    print(f"Decrypted file: {dec_path} ({dec_path.stat().st_size} bytes)")
+    top = heapq.nlargest(args.top_k, ranked, key=itemgetter(0))
+    for rank, (_, idx) in enumerate(top, start=1):
+        _process_video(videos[idx], username, outdir, args, label=f"Video {rank}/{len(top)}")
 
 
 if __name__ == "__main__":